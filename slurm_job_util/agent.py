@@ -0,0 +1,208 @@
+"""
+Slurm Job Util
+
+Copyright (c) 2024 by Wiep K. van der Toorn
+
+"""
+
+import itertools
+import json
+import logging
+import queue
+import re
+import shlex
+import subprocess
+import threading
+
+from .remote_agent import AGENT_COMMANDS
+
+REMOTE_AGENT_PATH = ".slurm-job-util/remote_agent.py"
+
+# characters that make the shell change argv, or do more than run one command
+SHELL_CHARS = "$`*?[{<>|;&#()!\n"
+
+
+class AgentSession:
+    """
+    A long-running `remote_agent.py` process on a remote host.
+
+    All requests share a single SSH channel, so executing a command costs one
+    round trip instead of a fresh SSH login (and Slurm client startup) per command.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        remote_path: str = REMOTE_AGENT_PATH,
+        ssh_options: list[str] | None = None,
+    ):
+        self.host = host
+        self.remote_path = remote_path
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._responses: queue.Queue = queue.Queue()
+        self._closed = False
+        self._acknowledged = False  # whether the agent has answered a request yet
+        self._process = subprocess.Popen(
+            ["ssh", *(ssh_options or []), host, f"python3 {remote_path}"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        threading.Thread(target=self._read_responses, daemon=True).start()
+
+    def _read_responses(self) -> None:
+        for line in self._process.stdout:
+            self._responses.put(line)
+        self._responses.put(None)  # agent exited
+
+    @property
+    def is_alive(self) -> bool:
+        return not self._closed and self._process.poll() is None
+
+    @staticmethod
+    def supports(command: str) -> bool:
+        try:
+            argv = shlex.split(command)
+        except ValueError:
+            return False
+        # commands relying on shell features (expansion, globs, redirection,
+        # pipes, ...) are left to ssh, as the agent runs commands without a shell.
+        # Single-quoted text is literal in the shell as well, so it may contain these.
+        unquoted = re.sub(r"'[^']*'", "", command)
+        if not argv or any(char in unquoted for char in SHELL_CHARS):
+            return False
+        if argv[0] == "cat":
+            return len(argv) == 2
+        return argv[0] in AGENT_COMMANDS
+
+    def _request(self, command: str, timeout: float | None) -> dict:
+        argv = shlex.split(command)
+        request = {"id": next(self._ids)}
+        if argv[0] == "cat":
+            request.update(op="read", path=argv[1])
+        else:
+            request.update(op="run", argv=argv, timeout=timeout)
+        return request
+
+    def _result(
+        self, command: str, request: dict, response: dict
+    ) -> subprocess.CompletedProcess:
+        if response.get("id") != request["id"]:
+            self.close()
+            raise ConnectionError(
+                f"Connection reset: agent on {self.host} answered out of order"
+            )
+        # returncode is None when the command timed out on the remote host
+        return subprocess.CompletedProcess(
+            command, response["returncode"], response["stdout"], response["stderr"]
+        )
+
+    def _roundtrip(self, request: dict | list[dict], timeout: float | None):
+        # errors before the agent could have received the request are reported as
+        # "Agent unavailable", which is safe to retry for any command (see retry.py)
+        with self._lock:
+            if not self.is_alive:
+                raise ConnectionError(f"Agent unavailable on {self.host}: not running")
+            try:
+                self._process.stdin.write(json.dumps(request) + "\n")
+                self._process.stdin.flush()
+            except OSError as e:
+                self.close()
+                raise ConnectionError(f"Agent unavailable on {self.host}: {e}")
+            try:
+                # allow for the round trip on top of the command timeout
+                line = self._responses.get(
+                    timeout=None if timeout is None else timeout + 30
+                )
+            except queue.Empty:
+                self.close()
+                raise ConnectionError(
+                    f"Connection timed out waiting for agent on {self.host}"
+                )
+            if line is None:
+                self.close()
+                if not self._acknowledged:
+                    # never answered anything, so it did not start at all
+                    raise ConnectionError(
+                        f"Agent unavailable on {self.host}: exited before answering"
+                    )
+                raise ConnectionError(f"Connection reset: agent on {self.host} exited")
+            self._acknowledged = True
+            return json.loads(line)
+
+    def ping(self, timeout: float = 30) -> None:
+        """Raise a `ConnectionError` if the agent does not answer."""
+        request = {"id": next(self._ids), "op": "ping"}
+        response = self._roundtrip(request, timeout)
+        if response.get("id") != request["id"] or response.get("returncode") != 0:
+            self.close()
+            raise ConnectionError(
+                f"Agent unavailable on {self.host}: unexpected answer {response}"
+            )
+
+    def execute(
+        self, command: str, timeout: float | None = None
+    ) -> subprocess.CompletedProcess:
+        request = self._request(command, timeout)
+        return self._result(command, request, self._roundtrip(request, timeout))
+
+    def execute_batch(
+        self, commands: list[str], timeout: float | None = None
+    ) -> list[subprocess.CompletedProcess]:
+        """Execute `commands` in order, in a single round trip."""
+        requests = [self._request(command, timeout) for command in commands]
+        total_timeout = None if timeout is None else timeout * len(commands)
+        responses = self._roundtrip(requests, total_timeout)
+        if len(responses) != len(requests):
+            self.close()
+            raise ConnectionError(
+                f"Connection reset: agent on {self.host} answered {len(responses)} "
+                f"of {len(requests)} requests"
+            )
+        return [
+            self._result(command, request, response)
+            for command, request, response in zip(commands, requests, responses)
+        ]
+
+    def close(self) -> None:
+        self._closed = True
+        if self._process.stdin and not self._process.stdin.closed:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+        if self._process.poll() is None:
+            self._process.terminate()
+
+
+_agents: dict[str, AgentSession] = {}
+_agents_lock = threading.Lock()
+
+
+def get_agent(host: str) -> AgentSession | None:
+    with _agents_lock:
+        agent = _agents.get(host)
+        if agent is not None and not agent.is_alive:
+            logging.warning(
+                f"Agent on {host} is no longer running, falling back to ssh"
+            )
+            del _agents[host]
+            agent = None
+        return agent
+
+
+def register_agent(agent: AgentSession) -> None:
+    with _agents_lock:
+        if agent.host in _agents:
+            _agents[agent.host].close()
+        _agents[agent.host] = agent
+
+
+def stop_agent(host: str) -> None:
+    with _agents_lock:
+        agent = _agents.pop(host, None)
+    if agent is not None:
+        agent.close()
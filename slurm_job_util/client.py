@@ -0,0 +1,289 @@
+"""
+Slurm Job Util
+
+Copyright (c) 2024 by Wiep K. van der Toorn
+
+"""
+
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Union
+
+from . import remote_agent
+from .agent import AgentSession, REMOTE_AGENT_PATH, register_agent, stop_agent
+from .retry import RemoteCommandError, get_default_policy
+from .slurm_job import SlurmJob, SBatchCommand
+from .ssh_config import SSHConfigEntry, get_ssh_entry
+from .utils import logging, CONFIG_DIR, execute_on_host, execute_batch_on_host
+
+QUEUE_FORMAT = "%i|%T|%M|%D|%R|%j"
+
+
+@dataclass
+class QueueEntry:
+    job_id: str  # not an int, array jobs are listed as e.g. "123_4"
+    state: str
+    time: str
+    nodes: int
+    reason: str
+    name: str
+
+    @classmethod
+    def from_line(cls, line: str) -> "QueueEntry":
+        # name last, as it is the only field that may contain the separator
+        job_id, state, time, nodes, reason, name = line.split("|", 5)
+        return cls(job_id, state, time, int(nodes), reason, name)
+
+
+class SlurmClient:
+    """
+    Client for a SLURM cluster, reachable through an entry in the ssh config.
+
+    The ssh config entry is parsed once, and commands share a single ssh
+    connection (kept open for `persist` seconds after the last command).
+    Results of `queue` and `status` are cached for `ttl` seconds, and
+    invalidated when a job is submitted or cancelled through this client.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        ttl: float = 10.0,
+        persist: int = 600,
+        ssh_config_path: str = os.path.expanduser("~/.ssh/config"),
+    ):
+        self.entry: SSHConfigEntry = get_ssh_entry(host, ssh_config_path)
+        self.ttl = ttl
+
+        os.makedirs(CONFIG_DIR, exist_ok=True)
+        self.ssh_options = [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={os.path.join(CONFIG_DIR, 'cm-%C')}",
+            "-o",
+            f"ControlPersist={persist}",
+        ]
+        self._cache: dict[Any, tuple[float, Any]] = {}
+        self._cache_lock = threading.Lock()
+
+    @property
+    def host(self) -> str:
+        return self.entry.host
+
+    def __enter__(self) -> "SlurmClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the agent, if any, and close the shared ssh connection."""
+        stop_agent(self.host)
+        subprocess.run(
+            ["ssh", *self.ssh_options, "-O", "exit", self.host], capture_output=True
+        )
+
+    def execute(
+        self, command: str, idempotent: bool = True
+    ) -> subprocess.CompletedProcess:
+        return execute_on_host(
+            self.host, command, idempotent=idempotent, ssh_options=self.ssh_options
+        )
+
+    def execute_batch(
+        self, commands: list[str], idempotent: bool = True
+    ) -> list[subprocess.CompletedProcess]:
+        return execute_batch_on_host(
+            self.host, commands, idempotent=idempotent, ssh_options=self.ssh_options
+        )
+
+    # caching
+
+    def _cached(self, key: Any, refresh: bool, fetch: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._cache_lock:
+            if not refresh and key in self._cache:
+                fetched_at, value = self._cache[key]
+                if now - fetched_at < self.ttl:
+                    return value
+        value = fetch()
+        with self._cache_lock:
+            self._cache[key] = (now, value)
+        return value
+
+    def invalidate(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+    # queries
+
+    def queue(self, refresh: bool = False) -> list[QueueEntry]:
+        def fetch():
+            stdout = self.execute(f"squeue --me -h -o '{QUEUE_FORMAT}'").stdout
+            return [QueueEntry.from_line(line) for line in stdout.splitlines() if line]
+
+        return self._cached("queue", refresh, fetch)
+
+    def status(self, job_id: int, refresh: bool = False) -> str:
+        def fetch():
+            return self.execute(f"squeue -j {job_id} -h -o %T").stdout.strip()
+
+        return self._cached(("status", job_id), refresh, fetch)
+
+    def statuses(self, job_ids: list[int], refresh: bool = False) -> dict[int, str]:
+        """Status of each job, looked up in a single round trip when an agent runs."""
+        now = time.monotonic()
+        statuses = {}
+        with self._cache_lock:
+            for job_id in job_ids:
+                fetched_at, status = self._cache.get(("status", job_id), (None, None))
+                if (
+                    not refresh
+                    and fetched_at is not None
+                    and now - fetched_at < self.ttl
+                ):
+                    statuses[job_id] = status
+
+        missing = [job_id for job_id in job_ids if job_id not in statuses]
+        results = self.execute_batch(
+            [f"squeue -j {job_id} -h -o %T" for job_id in missing]
+        )
+        with self._cache_lock:
+            for job_id, result in zip(missing, results):
+                statuses[job_id] = result.stdout.strip()
+                self._cache[("status", job_id)] = (now, statuses[job_id])
+        return {job_id: statuses[job_id] for job_id in job_ids}
+
+    def job(self, job_id: int) -> SlurmJob:
+        return SlurmJob(job_id=job_id, host=self.host, client=self)
+
+    def output(self, job_id_or_output_file: Union[int, str]) -> str:
+        job_id = None
+        output_file = None
+        try:
+            job_id = int(job_id_or_output_file)
+        except ValueError:
+            output_file = job_id_or_output_file
+
+        if job_id is not None:
+            if self.status(job_id, refresh=True) != "RUNNING":
+                raise ValueError(
+                    f"Job {job_id} is not running. Maybe it has already finished? "
+                    "Try supplying `--output_file` instead of `--job_id`."
+                )
+            # Get the job details using scontrol
+            try:
+                result = self.execute(f"scontrol show job {job_id}")
+            except RemoteCommandError as e:
+                raise ValueError(
+                    f"Failed to retrieve job details for job {job_id}: {e}."
+                )
+
+            job_details = result.stdout
+
+            # Extract the SBATCH_OUTPUT variable
+            match = re.search(r"StdOut=(\S+)", job_details)
+            if not match:
+                raise ValueError(f"Failed to find the output file of job {job_id}.")
+            output_file = match.group(1)
+
+        return self.execute(f"cat {output_file}").stdout
+
+    # actions
+
+    def rsync(self, local_path: str, remote_path: str) -> None:
+        # make local path abspath
+        local_path = os.path.abspath(local_path)
+
+        # rsync resolves relative remote paths against the remote home dir,
+        # the same dir commands are executed in
+        if remote_path.startswith("~/"):
+            remote_path = remote_path[2:]
+
+        # test if local_path is a file
+        if not os.path.isfile(local_path):
+            raise ValueError(f"Local path {local_path} is not a file")
+
+        logging.info(f"Rsyncing {local_path} to {self.host}:{remote_path}")
+        # no timeout, as transfers of large files may take long,
+        # ConnectTimeout catches unreachable hosts instead
+        ssh_command = ["ssh"]
+        connect_timeout = get_default_policy().connect_timeout
+        if connect_timeout is not None:
+            ssh_command += ["-o", f"ConnectTimeout={connect_timeout}"]
+        command = [
+            "rsync",
+            "-az",
+            "-e",
+            shlex.join([*ssh_command, *self.ssh_options]),
+            local_path,
+            f"{self.host}:{remote_path}",
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RemoteCommandError(
+                self.host, shlex.join(command), result.stderr, result.returncode
+            )
+        logging.info(f"Successfully rsynced {local_path} to {self.host}:{remote_path}")
+
+    def submit(self, script: str, **sbatch_args) -> SlurmJob:
+        """Submit a script on the remote host, see `SBatchCommand` for the arguments."""
+        # update keys of sbatch_args to be snake case
+        sbatch_args = {k.replace("-", "_"): v for k, v in sbatch_args.items()}
+        job_command = SBatchCommand(script=script, **sbatch_args)
+
+        logging.info(f"Submitting {job_command.script} to {self.host}")
+        logging.info(f"Job command: {job_command.command}")
+
+        result = self.execute(job_command.command, idempotent=False)
+        self.invalidate()
+
+        job_id = int(result.stdout.strip().split()[-1])
+        logging.info(f"Successfully submitted job. Job ID: {job_id}")
+        return self.job(job_id)
+
+    def cancel(self, job_id: int) -> None:
+        if self.status(job_id, refresh=True) in ["PENDING", "RUNNING", "STOPPED"]:
+            self.execute(f"scancel {job_id}")
+            self.invalidate()
+            logging.info("Cancelled the SLURM job")
+
+    def start_agent(self) -> AgentSession:
+        """
+        Copy the helper agent to the remote host and start it.
+
+        Until `close` is called, supported commands on this host (squeue, sacct,
+        scancel, sbatch, scontrol, mkdir and reading files) are executed by the
+        agent, see `remote_agent`.
+        """
+        self.execute(f"mkdir -p {os.path.dirname(REMOTE_AGENT_PATH)}")
+        self.rsync(remote_agent.__file__, REMOTE_AGENT_PATH)
+
+        agent = AgentSession(self.host, ssh_options=self.ssh_options)
+        try:
+            agent.ping()
+        except ConnectionError as e:
+            raise RemoteCommandError(
+                self.host, f"python3 {REMOTE_AGENT_PATH}", str(e), None
+            )
+        register_agent(agent)
+        logging.info(f"Started agent on {self.host}")
+        return agent
+
+
+_clients: dict[str, SlurmClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host: str) -> SlurmClient:
+    """Return a shared `SlurmClient` for `host`, creating it on first use."""
+    with _clients_lock:
+        if host not in _clients:
+            _clients[host] = SlurmClient(host)
+        return _clients[host]
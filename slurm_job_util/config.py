@@ -0,0 +1,20 @@
+"""
+Slurm Job Util
+
+Copyright (c) 2024 by Wiep K. van der Toorn
+
+"""
+
+import json
+import os
+
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".slurm-job-util")
+CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+
+
+def read_config_file(path: str | None = None) -> dict:
+    path = path or CONFIG_FILE
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            return json.load(file)
+    return {}
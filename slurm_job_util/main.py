@@ -6,29 +6,19 @@ Copyright (c) 2024 by Wiep K. van der Toorn
 """
 
 import argparse
-import os
-import json
 
-from .utils import CONFIG_FILE
+from .config import CONFIG_FILE, read_config_file
+from .retry import get_default_policy
+from .client import get_client
 from .entry_points import (
     init_remote_host,
     show_config,
     reset_config,
     submit_job,
-    rsync_to_remote_host,
-    get_job_output,
-    cancel_job,
     my_queue,
 )
 
 
-def read_config_file():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            return json.load(file)
-    return {}
-
-
 def main():
     config = read_config_file()
     default_remote_host = config.get("remote_host", None)
@@ -139,43 +129,50 @@ def main():
     if args.command == "init":
         _check_remote_host(args)
         init_remote_host(args.remote_host, args.remote_sbatch_dir)
+        return
     elif args.command == "show":
         show_config()
+        return
     elif args.command == "reset":
         reset_config()
-    elif args.command == "rsync":
-        _check_remote_host(args)
-        rsync_to_remote_host(args.remote_host, args.local_path, args.remote_path)
-    elif args.command == "submit":
-        _check_remote_host(args)
-
-        sbatch_args = {}
-        if args.sbatch:
-            for arg in args.sbatch:
-                key, value = arg.split("=", 1)
-                if key == "export":
-                    # Handle export argument specially
-                    sbatch_args[key] = value.split(",")  # should be list
-                else:
-                    sbatch_args[key] = value
-
-        submit_job(
-            args.remote_host,
-            args.remote_or_local_script,
-            args.remote_sbatch_dir,
-            **sbatch_args,
-        )
-    elif args.command == "output":
-        _check_remote_host(args)
-        print(get_job_output(args.remote_host, args.job_id_or_output_file))
-    elif args.command == "cancel":
-        _check_remote_host(args)
-        cancel_job(args.remote_host, args.job_id)
-    elif args.command == "queue":
-        _check_remote_host(args)
-        print(my_queue(args.remote_host))
-    else:
-        raise ValueError(f"Invalid command: {args.command}")
+        return
+
+    _check_remote_host(args)
+    try:
+        get_default_policy()  # report an invalid `retry` config entry up front
+    except (ValueError, TypeError) as e:
+        parser.error(f"Invalid config file {CONFIG_FILE}: {e}")
+
+    # one client, and so one ssh connection, for all commands of this run;
+    # closed on exit, so no ssh connection is left running in the background
+    with get_client(args.remote_host) as client:
+        if args.command == "rsync":
+            client.rsync(args.local_path, args.remote_path)
+        elif args.command == "submit":
+            sbatch_args = {}
+            if args.sbatch:
+                for arg in args.sbatch:
+                    key, value = arg.split("=", 1)
+                    if key == "export":
+                        # Handle export argument specially
+                        sbatch_args[key] = value.split(",")  # should be list
+                    else:
+                        sbatch_args[key] = value
+
+            submit_job(  # uses the same client, through get_client
+                args.remote_host,
+                args.remote_or_local_script,
+                args.remote_sbatch_dir,
+                **sbatch_args,
+            )
+        elif args.command == "output":
+            print(client.output(args.job_id_or_output_file))
+        elif args.command == "cancel":
+            client.cancel(args.job_id)
+        elif args.command == "queue":
+            print(my_queue(args.remote_host))  # uses the same client
+        else:
+            raise ValueError(f"Invalid command: {args.command}")
 
 
 if __name__ == "__main__":
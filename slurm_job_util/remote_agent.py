@@ -0,0 +1,104 @@
+"""
+Slurm Job Util
+
+Copyright (c) 2024 by Wiep K. van der Toorn
+
+Helper agent that runs on the remote host.
+
+This file is copied to the remote host as-is and run there with `python3`,
+so it must only depend on the standard library.
+
+Requests are read from stdin, one JSON document per line, and answered on
+stdout in the same way. A line holds either a single request, or a list of
+requests that are executed in order and answered with a list:
+
+    {"id": 1, "op": "run", "argv": ["squeue", "--me"], "timeout": 60}
+    {"id": 2, "op": "read", "path": "~/slurm-123.out"}
+    {"id": 3, "op": "ping"}
+
+Each response has the form:
+
+    {"id": 1, "returncode": 0, "stdout": "...", "stderr": ""}
+
+`returncode` is null when the command timed out.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# programs the agent is allowed to run
+AGENT_COMMANDS = ("squeue", "sacct", "scancel", "sbatch", "scontrol", "mkdir")
+
+
+def _response(request_id, returncode, stdout="", stderr=""):
+    return {
+        "id": request_id,
+        "returncode": returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+    }
+
+
+def run(request_id, argv, timeout=None):
+    if not argv or argv[0] not in AGENT_COMMANDS:
+        return _response(request_id, 1, stderr=f"Command not allowed: {argv}")
+
+    argv = [os.path.expanduser(arg) if arg.startswith("~") else arg for arg in argv]
+    try:
+        result = subprocess.run(
+            argv,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return _response(request_id, None, stderr=f"Timed out after {timeout}s")
+    except OSError as e:
+        return _response(request_id, 127, stderr=str(e))
+    return _response(request_id, result.returncode, result.stdout, result.stderr)
+
+
+def read(request_id, path):
+    path = os.path.expanduser(path)
+    try:
+        with open(path, "r", errors="replace") as f:
+            return _response(request_id, 0, stdout=f.read())
+    except OSError as e:
+        return _response(request_id, 1, stderr=f"cat: {path}: {e.strerror}")
+
+
+def handle(request):
+    request_id = request.get("id")
+    op = request.get("op")
+    if op == "run":
+        return run(request_id, request.get("argv", []), request.get("timeout"))
+    elif op == "read":
+        return read(request_id, request.get("path", ""))
+    elif op == "ping":
+        return _response(request_id, 0)
+    return _response(request_id, 1, stderr=f"Invalid op: {op}")
+
+
+def main():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = _response(None, 1, stderr=f"Invalid request: {e}")
+        else:
+            if isinstance(request, list):
+                response = [handle(r) for r in request]
+            else:
+                response = handle(request)
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Slurm Job Util
+
+Copyright (c) 2024 by Wiep K. van der Toorn
+
+"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, fields
+
+from .config import read_config_file
+
+# stderr fragments of failures that happen before the remote command ran,
+# retrying these is always safe
+CONNECTION_ERRORS = (
+    "Connection refused",
+    "Connection closed by",
+    "Could not resolve hostname",
+    "Network is unreachable",
+    "No route to host",
+    "ssh_exchange_identification",
+    "kex_exchange_identification",
+    "Agent unavailable",  # see AgentSession, the request never reached the agent
+)
+
+# stderr fragments of transient failures where the remote command may have
+# had an effect, only retried for idempotent commands.
+# Match the cause, not the prefix: e.g. "slurm_load_jobs error: Invalid job id
+# specified" is permanent, "slurm_load_jobs error: Socket timed out ..." is not.
+TRANSIENT_ERRORS = (
+    "Connection reset",
+    "Connection timed out",
+    "Broken pipe",
+    "Socket timed out",
+    "Unable to contact slurm controller",
+    "Resource temporarily unavailable",
+    "Slurm backup controller in standby mode",
+    "Slurm temporarily unable to accept job",
+)
+
+
+class RemoteCommandError(Exception):
+    def __init__(self, host: str, command: str, stderr: str, returncode: int | None):
+        self.host = host
+        self.command = command
+        self.stderr = stderr
+        self.returncode = returncode
+        super().__init__(
+            f"Failed to execute command on host! \nhost: {host}\ncommand: {command}\n{stderr}"
+        )
+
+
+class CircuitOpenError(RemoteCommandError):
+    def __init__(self, host: str, command: str, retry_in: float):
+        super().__init__(
+            host,
+            command,
+            f"Too many consecutive failures on {host}, not retrying for {retry_in:.0f}s",
+            None,
+        )
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Timeouts, retries and circuit breaking for commands executed on a remote host.
+
+    A command is attempted at most `max_attempts` times. Between attempts,
+    a random delay of up to `backoff_base * 2**attempt` seconds (capped at
+    `backoff_max`) is awaited. After `breaker_threshold` consecutive failed
+    commands on a host, further commands on that host fail immediately for
+    `breaker_reset` seconds.
+    """
+
+    max_attempts: int = 4
+    timeout: float | None = 120.0
+    connect_timeout: int | None = 15
+    backoff_base: float = 1.0
+    backoff_max: float = 30.0
+    breaker_threshold: int = 5
+    breaker_reset: float = 60.0
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError(
+                f"max_attempts must be at least 1, got {self.max_attempts}"
+            )
+        if self.breaker_threshold < 1:
+            raise ValueError(
+                f"breaker_threshold must be at least 1, got {self.breaker_threshold}"
+            )
+        for name in ("timeout", "connect_timeout"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive or None, got {value}")
+        for name in ("backoff_base", "backoff_max", "breaker_reset"):
+            value = getattr(self, name)
+            if value < 0:
+                raise ValueError(f"{name} must not be negative, got {value}")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RetryPolicy":
+        """Create a policy from the `retry` entry of the config file."""
+        valid_keys = [f.name for f in fields(cls)]
+        unknown_keys = [key for key in config if key not in valid_keys]
+        if unknown_keys:
+            raise ValueError(
+                f"Unknown keys in 'retry' config entry: {', '.join(unknown_keys)}. "
+                f"Valid keys are: {', '.join(valid_keys)}"
+            )
+        return cls(**config)
+
+    def backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def is_retryable(
+        self, returncode: int | None, stderr: str, idempotent: bool = True
+    ) -> bool:
+        if any(error in stderr for error in CONNECTION_ERRORS):
+            return True
+        if not idempotent:
+            return False
+        if returncode is None:  # timed out
+            return True
+        return any(error in stderr for error in TRANSIENT_ERRORS)
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, threshold: int, reset: float):
+        self.host = host
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Seconds until the next command may be attempted, 0 if it may be attempted now."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            # half-open after `reset` seconds: let a command through to probe the host
+            return max(0.0, self.opened_at + self.reset - time.monotonic())
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logging.warning(
+                        f"{self.failures} consecutive failures on {self.host}, pausing commands for {self.reset:.0f}s"
+                    )
+                self.opened_at = time.monotonic()
+
+
+_default_policy: RetryPolicy | None = None
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_default_policy() -> RetryPolicy:
+    """The policy set with `set_default_policy`, else the `retry` entry of the config file."""
+    global _default_policy
+    if _default_policy is None:
+        _default_policy = RetryPolicy.from_config(read_config_file().get("retry", {}))
+    return _default_policy
+
+
+def set_default_policy(policy: RetryPolicy) -> None:
+    global _default_policy
+    _default_policy = policy
+
+
+def get_breaker(host: str, policy: RetryPolicy) -> CircuitBreaker:
+    """Return the breaker of `host`, using the settings of `policy`."""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(
+                host, policy.breaker_threshold, policy.breaker_reset
+            )
+        breaker = _breakers[host]
+    # the failure count is kept per host, the settings follow the current policy
+    with breaker._lock:
+        breaker.threshold = policy.breaker_threshold
+        breaker.reset = policy.breaker_reset
+    return breaker
@@ -6,10 +6,14 @@ Copyright (c) 2024 by Wiep K. van der Toorn
 """
 
 import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
 from .utils import logging, execute_on_host
 
+if TYPE_CHECKING:
+    from .client import SlurmClient
+
 
 @dataclass
 class SBatchCommand:
@@ -80,17 +84,25 @@ class SBatchCommand:
 class SlurmJob:
     job_id: int
     host: str
+    # when set, commands go through the client's shared connection and cache
+    client: "SlurmClient | None" = field(default=None, repr=False, compare=False)
 
     def execute_on_host(self, command: str) -> subprocess.CompletedProcess:
+        if self.client is not None:
+            return self.client.execute(command)
         return execute_on_host(self.host, command)
 
     def cancel(self) -> None:
+        if self.client is not None:
+            return self.client.cancel(self.job_id)
         if self.status in ["PENDING", "RUNNING", "STOPPED"]:
             self.execute_on_host(f"scancel {self.job_id}")
             logging.info("Cancelled the SLURM job")
 
     @property
     def status(self) -> str:
+        if self.client is not None:
+            return self.client.status(self.job_id)
         return self.execute_on_host(f"squeue -j {self.job_id} -h -o %T").stdout.strip()
 
     @property
@@ -6,11 +6,18 @@ Copyright (c) 2024 by Wiep K. van der Toorn
 """
 
 import logging
-import os
 import subprocess
+import time
 
-CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".slurm-job-util")
-CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+from .agent import get_agent
+from .config import CONFIG_DIR, CONFIG_FILE
+from .retry import (
+    RetryPolicy,
+    RemoteCommandError,
+    CircuitOpenError,
+    get_breaker,
+    get_default_policy,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -18,10 +25,113 @@ logging.basicConfig(
 )
 
 
-def execute_on_host(host: str, command: str) -> subprocess.CompletedProcess:
-    result = subprocess.run(["ssh", host, command], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(
-            f"Failed to execute command on host! \nhost: {host}\ncommand: {command}\n{result.stderr}"
+def execute_on_host(
+    host: str,
+    command: str,
+    timeout: float | None = None,
+    policy: RetryPolicy | None = None,
+    idempotent: bool = True,
+    ssh_options: list[str] | None = None,
+) -> subprocess.CompletedProcess:
+    """
+    Execute `command` on `host` over ssh, retrying transient failures.
+
+    If an agent was started on `host` (see `start_agent`), supported commands
+    are sent to it instead of opening a new ssh connection.
+
+    `timeout` overrides the per-attempt timeout of the policy.
+    Set `idempotent` to False for commands that must not run twice (e.g. sbatch),
+    these are only retried when the connection to the host could not be made.
+    `ssh_options` are passed to ssh as-is, e.g. to share a connection.
+    """
+    return execute_batch_on_host(
+        host, [command], timeout, policy, idempotent, ssh_options
+    )[0]
+
+
+def execute_batch_on_host(
+    host: str,
+    commands: list[str],
+    timeout: float | None = None,
+    policy: RetryPolicy | None = None,
+    idempotent: bool = True,
+    ssh_options: list[str] | None = None,
+) -> list[subprocess.CompletedProcess]:
+    """
+    Execute `commands` on `host` in order, see `execute_on_host`.
+
+    If an agent was started on `host` and supports all commands, they are sent
+    to it in a single round trip, and retried together. Otherwise, they are
+    executed one by one. Raises for the first command that fails.
+    """
+    if not commands:
+        return []
+
+    policy = policy or get_default_policy()
+    timeout = timeout if timeout is not None else policy.timeout
+    breaker = get_breaker(host, policy)
+
+    ssh_command = ["ssh"]
+    if policy.connect_timeout is not None:
+        ssh_command += ["-o", f"ConnectTimeout={policy.connect_timeout}"]
+    ssh_command += [*(ssh_options or []), host]
+
+    for attempt in range(policy.max_attempts):
+        # also checked between retries, as other commands may have opened it meanwhile
+        retry_in = breaker.retry_in()
+        if retry_in > 0:
+            raise CircuitOpenError(host, "; ".join(commands), retry_in)
+
+        agent = get_agent(host)
+        use_agent = agent is not None and all(agent.supports(c) for c in commands)
+        if not use_agent and len(commands) > 1:
+            return [
+                execute_on_host(host, command, timeout, policy, idempotent, ssh_options)
+                for command in commands
+            ]
+
+        try:
+            # failures as (command, stderr, returncode)
+            if use_agent:
+                results = agent.execute_batch(commands, timeout)
+            else:
+                results = [
+                    subprocess.run(
+                        [*ssh_command, commands[0]],
+                        capture_output=True,
+                        text=True,
+                        timeout=timeout,
+                    )
+                ]
+            failed = [
+                (command, result.stderr, result.returncode)
+                for command, result in zip(commands, results)
+                if result.returncode != 0
+            ]
+        except subprocess.TimeoutExpired:
+            failed = [(commands[0], f"Timed out after {timeout}s", None)]
+        except ConnectionError as e:
+            # the agent is gone, its message tells whether the commands may have run
+            failed = [("; ".join(commands), str(e), None)]
+
+        if not failed:
+            breaker.record_success()
+            return results
+
+        permanent = [
+            f for f in failed if not policy.is_retryable(f[2], f[1], idempotent)
+        ]
+        if permanent:
+            raise RemoteCommandError(host, *permanent[0])
+        if attempt == policy.max_attempts - 1:
+            # one failure per command, once its retries are used up
+            breaker.record_failure()
+            raise RemoteCommandError(host, *failed[0])
+
+        _, stderr, returncode = failed[0]
+        delay = policy.backoff(attempt)
+        reason = stderr.strip().splitlines()[-1] if stderr.strip() else returncode
+        logging.warning(
+            f"Transient failure on {host} ({reason}), retrying in {delay:.1f}s"
         )
-    return result
+        time.sleep(delay)
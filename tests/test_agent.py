@@ -0,0 +1,154 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from slurm_job_util import remote_agent
+from slurm_job_util.agent import AgentSession, register_agent, stop_agent
+from slurm_job_util.retry import RetryPolicy
+from slurm_job_util.utils import execute_batch_on_host, execute_on_host
+
+_popen = subprocess.Popen
+_run = subprocess.run
+
+
+def _local_agent(monkeypatch, argv=None):
+    """Run the agent as a local process instead of over ssh."""
+    argv = argv or [sys.executable, remote_agent.__file__]
+
+    def popen(args, **kwargs):
+        if args[0] == "ssh":
+            # like ssh, start in the home dir
+            args, kwargs["cwd"] = argv, os.environ["HOME"]
+        return _popen(args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", popen)
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / "slurm-1.out").write_text("hello\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "squeue --me",
+        "squeue -j 123 -h -o %T",
+        "squeue --me -h -o '%i|%T|%M|%D|%R|%j'",
+        "sbatch --time=1:00 --export=A=1,B=2 ~/sbatch/job.sbatch",
+        "mkdir -p ~/sbatch",
+        "cat slurm-123.out",
+    ],
+)
+def test_supported_commands(command):
+    assert AgentSession.supports(command)
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "squeue -u $USER",
+        "cat $HOME/x",
+        "squeue -u `whoami`",
+        "squeue -u $(whoami)",
+        "cat slurm-*.out",
+        "cat slurm-12?.out",
+        "squeue --me 2>/dev/null",
+        "squeue --me | wc -l",
+        "mkdir -p a && cat b",
+        "cat slurm-{1,2}.out",
+        "squeue --me # x",
+        "squeue --me; (cat a)",
+        "squeue -u !$",
+        "squeue --me\ncat a",
+        "cat a b",
+        "sinfo",
+        "",
+    ],
+)
+def test_shell_commands_are_not_supported(command):
+    assert not AgentSession.supports(command)
+
+
+def test_single_quoted_shell_chars_are_supported():
+    assert AgentSession.supports("squeue --me -h -o '%i|%T'")
+    assert not AgentSession.supports('squeue --me -h -o "%i|$USER"')
+
+
+def test_roundtrip(home, monkeypatch):
+    _local_agent(monkeypatch)
+    agent = AgentSession("local")
+    try:
+        agent.ping()
+        assert agent.execute("cat ~/slurm-1.out").stdout == "hello\n"
+        assert agent.execute("mkdir -p ~/sbatch").returncode == 0
+        assert (home / "sbatch").is_dir()
+        assert agent.execute("cat missing.out").returncode == 1
+    finally:
+        agent.close()
+
+
+def test_batch(home, monkeypatch):
+    _local_agent(monkeypatch)
+    agent = AgentSession("local")
+    try:
+        results = agent.execute_batch(["cat slurm-1.out", "mkdir -p a", "cat x"])
+        assert [r.returncode for r in results] == [0, 0, 1]
+        assert results[0].stdout == "hello\n"
+    finally:
+        agent.close()
+
+
+def test_agent_that_does_not_start(monkeypatch):
+    _local_agent(monkeypatch, [sys.executable, "-c", "pass"])
+    agent = AgentSession("local")
+    with pytest.raises(ConnectionError, match="Agent unavailable"):
+        agent.ping()
+
+
+def _ssh_run(calls):
+    def run(args, **kwargs):
+        if args[0] != "ssh":
+            return _run(args, **kwargs)
+        calls.append(args[-1])
+        return subprocess.CompletedProcess(args, 0, "via ssh\n", "")
+
+    return run
+
+
+def test_execute_on_host_uses_agent(home, monkeypatch):
+    calls = []
+    _local_agent(monkeypatch)
+    monkeypatch.setattr(subprocess, "run", _ssh_run(calls))
+    register_agent(AgentSession("agent-host"))
+    try:
+        assert execute_on_host("agent-host", "cat slurm-1.out").stdout == "hello\n"
+        results = execute_batch_on_host("agent-host", ["cat slurm-1.out", "mkdir -p a"])
+        assert [r.returncode for r in results] == [0, 0]
+        # needs a shell, so over ssh
+        assert execute_on_host("agent-host", "cat $HOME/x").stdout == "via ssh\n"
+        assert calls == ["cat $HOME/x"]
+    finally:
+        stop_agent("agent-host")
+
+
+def test_sbatch_falls_back_to_ssh_if_agent_did_not_start(monkeypatch):
+    calls = []
+    _local_agent(monkeypatch, [sys.executable, "-c", "pass"])
+    monkeypatch.setattr(subprocess, "run", _ssh_run(calls))
+    register_agent(AgentSession("dead-agent-host"))
+    try:
+        result = execute_on_host(
+            "dead-agent-host",
+            "sbatch job.sbatch",
+            policy=RetryPolicy(backoff_base=0),
+            idempotent=False,
+        )
+        assert result.stdout == "via ssh\n"
+        assert calls == ["sbatch job.sbatch"]
+    finally:
+        stop_agent("dead-agent-host")
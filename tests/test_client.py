@@ -0,0 +1,132 @@
+import subprocess
+
+import pytest
+
+from slurm_job_util import client as client_module
+from slurm_job_util.client import QueueEntry, SlurmClient
+
+
+class FakeHost:
+    def __init__(self):
+        self.commands = []
+        self.state = "PENDING"
+
+    def execute(self, host, command, idempotent=True, ssh_options=None):
+        self.commands.append(command)
+        if command.startswith("squeue --me"):
+            stdout = f"42|{self.state}|0:00|1|(Priority)|job\n"
+        elif command.startswith("squeue -j"):
+            stdout = f"{self.state}\n"
+        elif command.startswith("sbatch"):
+            stdout = "Submitted batch job 42\n"
+        else:
+            stdout = ""
+        return subprocess.CompletedProcess(command, 0, stdout, "")
+
+    def execute_batch(self, host, commands, idempotent=True, ssh_options=None):
+        self.commands.append(commands)
+        return [
+            subprocess.CompletedProcess(command, 0, f"{self.state}\n", "")
+            for command in commands
+        ]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(client_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def host(monkeypatch):
+    host = FakeHost()
+    monkeypatch.setattr(client_module, "execute_on_host", host.execute)
+    monkeypatch.setattr(client_module, "execute_batch_on_host", host.execute_batch)
+    return host
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, host, clock):
+    ssh_config = tmp_path / "ssh_config"
+    ssh_config.write_text("Host cluster\n\tHostName login.example.com\n\tUser me\n")
+    monkeypatch.setattr(client_module, "CONFIG_DIR", str(tmp_path / "config"))
+    return SlurmClient("cluster", ttl=10, ssh_config_path=str(ssh_config))
+
+
+def test_queue_is_cached_for_ttl(client, host, clock):
+    assert client.queue() == [
+        QueueEntry("42", "PENDING", "0:00", 1, "(Priority)", "job")
+    ]
+    clock[0] += 9
+    client.queue()
+    assert len(host.commands) == 1
+
+    clock[0] += 1
+    client.queue()
+    assert len(host.commands) == 2
+
+
+def test_refresh(client, host):
+    client.status(42)
+    client.status(42, refresh=True)
+    assert host.commands == ["squeue -j 42 -h -o %T"] * 2
+
+
+def test_submit_invalidates_cache(client, host):
+    client.queue()
+    client.status(42)
+    job = client.submit("job.sbatch", time="1:00")
+    assert job.job_id == 42 and job.client is client
+
+    host.state = "RUNNING"
+    assert client.queue()[0].state == "RUNNING"
+    assert job.status == "RUNNING"
+    assert host.commands[2] == "sbatch --time=1:00 job.sbatch"
+    assert len(host.commands) == 5
+
+
+def test_cancel_refreshes_status_and_invalidates_cache(client, host):
+    client.queue()
+    client.status(42)
+    client.cancel(42)
+    assert host.commands[2:] == ["squeue -j 42 -h -o %T", "scancel 42"]
+
+    client.queue()
+    assert len(host.commands) == 5
+
+
+def test_cancel_finished_job(client, host):
+    host.state = ""
+    client.cancel(42)
+    assert "scancel 42" not in host.commands
+
+
+def test_statuses_fetches_missing_in_one_batch(client, host):
+    client.status(1)
+    assert client.statuses([1, 2, 3]) == {1: "PENDING", 2: "PENDING", 3: "PENDING"}
+    assert host.commands[1] == ["squeue -j 2 -h -o %T", "squeue -j 3 -h -o %T"]
+
+    client.status(3)
+    assert len(host.commands) == 2
+
+
+@pytest.mark.parametrize(
+    "line, entry",
+    [
+        (
+            "123|RUNNING|1:02|2|node[01-02]|train",
+            QueueEntry("123", "RUNNING", "1:02", 2, "node[01-02]", "train"),
+        ),
+        (
+            "1_[1-3]|PENDING|0:00|1|(Resources)|array",
+            QueueEntry("1_[1-3]", "PENDING", "0:00", 1, "(Resources)", "array"),
+        ),
+        (
+            "7_2|RUNNING|0:01|1|node01|a|b|c",
+            QueueEntry("7_2", "RUNNING", "0:01", 1, "node01", "a|b|c"),
+        ),
+    ],
+)
+def test_queue_entry_from_line(line, entry):
+    assert QueueEntry.from_line(line) == entry
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from slurm_job_util import config, entry_points, retry
+from slurm_job_util.retry import RetryPolicy, get_default_policy
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    monkeypatch.setattr(config, "CONFIG_FILE", str(path))
+    monkeypatch.setattr(entry_points, "CONFIG_FILE", str(path))
+    monkeypatch.setattr(retry, "_default_policy", None)
+    return path
+
+
+def test_default_policy_from_config_file(config_file):
+    config_file.write_text(json.dumps({"retry": {"max_attempts": 2}}))
+    assert get_default_policy() == RetryPolicy(max_attempts=2)
+
+
+def test_default_policy_without_config_file(config_file):
+    assert get_default_policy() == RetryPolicy()
+
+
+def test_init_keeps_other_entries(config_file):
+    config_file.write_text(
+        json.dumps({"remote_host": "old", "retry": {"max_attempts": 2}})
+    )
+    entry_points.init_remote_host("new")
+    assert json.loads(config_file.read_text()) == {
+        "remote_host": "new",
+        "retry": {"max_attempts": 2},
+    }
@@ -0,0 +1,65 @@
+import io
+import json
+import sys
+
+from slurm_job_util import remote_agent
+
+
+def test_run():
+    response = remote_agent.handle({"id": 1, "op": "run", "argv": ["mkdir", "--help"]})
+    assert response["id"] == 1
+    assert response["returncode"] == 0
+    assert "mkdir" in response["stdout"]
+
+
+def test_run_rejects_other_commands():
+    response = remote_agent.handle({"id": 1, "op": "run", "argv": ["rm", "-rf", "x"]})
+    assert response["returncode"] == 1
+    assert "Command not allowed" in response["stderr"]
+
+
+def test_run_timeout(monkeypatch):
+    monkeypatch.setattr(remote_agent, "AGENT_COMMANDS", ("sleep",))
+    response = remote_agent.run(1, ["sleep", "5"], timeout=0.1)
+    assert response["returncode"] is None
+    assert "Timed out" in response["stderr"]
+
+
+def test_run_expands_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    response = remote_agent.run(1, ["mkdir", "-p", "~/sbatch"])
+    assert response["returncode"] == 0
+    assert (tmp_path / "sbatch").is_dir()
+
+
+def test_read(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / "slurm-1.out").write_text("hello\n")
+    response = remote_agent.handle({"id": 1, "op": "read", "path": "~/slurm-1.out"})
+    assert response == {"id": 1, "returncode": 0, "stdout": "hello\n", "stderr": ""}
+
+
+def test_read_error(tmp_path):
+    response = remote_agent.read(1, str(tmp_path / "missing.out"))
+    assert response["returncode"] == 1
+    assert "No such file or directory" in response["stderr"]
+
+
+def test_main(monkeypatch):
+    requests = [
+        {"id": 1, "op": "ping"},
+        [{"id": 2, "op": "ping"}, {"id": 3, "op": "unknown"}],
+    ]
+    stdin = "\n".join(json.dumps(r) for r in requests) + "\nnot json\n"
+    stdout = io.StringIO()
+    monkeypatch.setattr(sys, "stdin", io.StringIO(stdin))
+    monkeypatch.setattr(sys, "stdout", stdout)
+
+    remote_agent.main()
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert responses[0]["id"] == 1 and responses[0]["returncode"] == 0
+    assert [r["id"] for r in responses[1]] == [2, 3]
+    assert responses[1][1]["stderr"] == "Invalid op: unknown"
+    assert responses[2]["returncode"] == 1
+    assert responses[2]["stderr"].startswith("Invalid request")
@@ -0,0 +1,146 @@
+import subprocess
+import time
+
+import pytest
+
+from slurm_job_util.retry import (
+    CircuitOpenError,
+    RemoteCommandError,
+    RetryPolicy,
+    get_breaker,
+)
+from slurm_job_util.utils import execute_on_host
+
+
+@pytest.mark.parametrize(
+    "stderr",
+    [
+        "slurm_load_jobs error: Socket timed out on send/recv operation",
+        "squeue: error: Unable to contact slurm controller (connect failure)",
+        "sbatch: error: Batch job submission failed: Resource temporarily unavailable",
+        "scancel: error: Slurm temporarily unable to accept job, sleeping and retrying",
+        "client_loop: send disconnect: Connection reset by peer",
+    ],
+)
+def test_transient_errors_are_retried(stderr):
+    assert RetryPolicy().is_retryable(1, stderr)
+
+
+@pytest.mark.parametrize(
+    "stderr",
+    [
+        "slurm_load_jobs error: Invalid job id specified",
+        "scancel: error: Kill job error on job id 123: Invalid job id specified",
+        "sbatch: error: Batch job submission failed: Invalid account or account/partition combination specified",
+        "cat: slurm-123.out: No such file or directory",
+        "",
+    ],
+)
+def test_permanent_errors_are_not_retried(stderr):
+    assert not RetryPolicy().is_retryable(1, stderr)
+
+
+def test_timeout_is_retried_only_if_idempotent():
+    assert RetryPolicy().is_retryable(None, "Timed out after 120s")
+    assert not RetryPolicy().is_retryable(
+        None, "Timed out after 120s", idempotent=False
+    )
+
+
+def test_non_idempotent_retried_only_on_connection_errors():
+    policy = RetryPolicy()
+    assert policy.is_retryable(
+        255, "ssh: connect to host h port 22: Connection refused", idempotent=False
+    )
+    assert policy.is_retryable(
+        None, "Agent unavailable on h: exited before answering", idempotent=False
+    )
+    assert not policy.is_retryable(
+        1,
+        "slurm_load_jobs error: Socket timed out on send/recv operation",
+        idempotent=False,
+    )
+    assert not policy.is_retryable(
+        None, "Connection reset: agent on h exited", idempotent=False
+    )
+
+
+def _fake_run(stderr, returncode, calls):
+    def run(*args, **kwargs):
+        calls.append(args[0])
+        return subprocess.CompletedProcess(args[0], returncode, "", stderr)
+
+    return run
+
+
+def test_invalid_job_id_is_not_retried(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        subprocess,
+        "run",
+        _fake_run("slurm_load_jobs error: Invalid job id specified", 1, calls),
+    )
+    policy = RetryPolicy(breaker_threshold=1)
+
+    for _ in range(3):
+        with pytest.raises(RemoteCommandError) as e:
+            execute_on_host("invalid-job-host", "squeue -j 1 -h -o %T", policy=policy)
+        assert not isinstance(e.value, CircuitOpenError)
+    assert len(calls) == 3
+
+
+def test_breaker_counts_failed_commands_not_attempts(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        subprocess,
+        "run",
+        _fake_run(
+            "slurm_load_jobs error: Socket timed out on send/recv operation", 1, calls
+        ),
+    )
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+    policy = RetryPolicy(max_attempts=4, breaker_threshold=2)
+
+    for _ in range(2):
+        with pytest.raises(RemoteCommandError) as e:
+            execute_on_host("busy-host", "squeue --me", policy=policy)
+        assert not isinstance(e.value, CircuitOpenError)
+    assert len(calls) == 8
+
+    with pytest.raises(CircuitOpenError):
+        execute_on_host("busy-host", "squeue --me", policy=policy)
+    assert len(calls) == 8
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"max_attempts": 0},
+        {"breaker_threshold": 0},
+        {"timeout": 0},
+        {"connect_timeout": -1},
+        {"backoff_base": -1},
+        {"backoff_max": -1},
+        {"breaker_reset": -1},
+    ],
+)
+def test_invalid_policy(kwargs):
+    with pytest.raises(ValueError):
+        RetryPolicy(**kwargs)
+
+
+def test_policy_from_config():
+    assert RetryPolicy.from_config({"max_attempts": 2}) == RetryPolicy(max_attempts=2)
+    with pytest.raises(
+        ValueError, match="Unknown keys in 'retry' config entry: retries"
+    ):
+        RetryPolicy.from_config({"retries": 2})
+
+
+def test_breaker_follows_current_policy():
+    breaker = get_breaker("policy-host", RetryPolicy(breaker_threshold=5))
+    assert get_breaker("policy-host", RetryPolicy(breaker_threshold=1)) is breaker
+    breaker.record_failure()
+    assert breaker.retry_in() > 0
+    get_breaker("policy-host", RetryPolicy(breaker_reset=0))
+    assert breaker.retry_in() == 0